@@ -11,6 +11,7 @@ import sys
 import platform
 from pathlib import Path
 from PyQt5.QtWidgets import QAction, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout, QMessageBox, QFileDialog, QDialog, QApplication, QMainWindow
+from PyQt5.QtCore import QTimer
 from PyQt5 import QtGui
 import configparser
 
@@ -18,6 +19,19 @@ import configparser
 import toothbase
 import helper_functions
 
+# options for the file dialogs, to avoid per-file work that is slow on large folders and network drives
+FAST_FILE_DIALOG_OPTIONS = QFileDialog.DontResolveSymlinks | QFileDialog.DontUseCustomDirectoryIcons
+
+# window icon of the message boxes (loaded on first use, as a QIcon can't be created before the QApplication)
+_WARNING_ICON = None
+
+def get_warning_icon():
+    """Return the icon for the message boxes, loading it from disk only once"""
+    global _WARNING_ICON
+    if _WARNING_ICON is None:
+        _WARNING_ICON = QtGui.QIcon(helper_functions.get_absolute_path('icon.png'))
+    return _WARNING_ICON
+
 class DatabaseMenu:
 
     def __init__(self, parent):
@@ -32,12 +46,18 @@ class DatabaseMenu:
         self.select_existing_database_option.triggered.connect(self.select_existing_database)
         self.database_menu.addAction(self.select_existing_database_option)
 
+        # resolve the config file path and parse the config file only once (see update_config_file for writes)
+        self._config_path = self.get_config_file_path()
+        self._config = configparser.ConfigParser()
+        self._config.read(self._config_path)
+
         # initialize the name of the current database
         self.db_path = None
         self.table_name = None
         # Read the config file to get the name of the current database
         self.db_path, self.table_name = self.read_config_file()
-        self.update_database_name_at_parent(self.db_path)
+        # (the initial image drop tab is opened only after the main window is shown, see update_database_name_at_parent)
+        self.update_database_name_at_parent(self.db_path, defer_tab=True)
 
     def get_config_file_path(self):
         """Get the path to the config.ini file."""
@@ -58,31 +78,38 @@ class DatabaseMenu:
         return config_file_path
 
     def read_config_file(self):
-        """Read the config file to get the name of the current database"""
-        config = configparser.ConfigParser()
-        #config.read('config.ini')
-        config_file_path = self.get_config_file_path()
-        config.read(config_file_path)
+        """Read the config file to get the name of the current database (from the config parsed in __init__, no disk access)"""
         try:
-            db_path = config['database']['db_path']
-            table_name = config['database']['table_name']
+            db_path = self._config['database']['db_path']
+            table_name = self._config['database']['table_name']
         except KeyError as e:
             raise KeyError(f"Missing section or key in config file: {e}")
         
         return db_path, table_name
 
-    def update_database_name_at_parent(self, db_name):
-        """Update the name of the current database to the parent. (i.e. the main window at toothseeker.py)"""
+    def update_database_name_at_parent(self, db_name, defer_tab=False):
+        """Update the name of the current database to the parent. (i.e. the main window at toothseeker.py)
+        With defer_tab=True the image drop tab is opened only once the event loop runs (used at startup, so that the main window gets shown first)."""
 
         # get the absolute path of the database (to make sure it works on all platforms)
         db_path = helper_functions.get_absolute_path(db_name)
 
+        # close the cached connection to the previously selected database
+        old_db_path = getattr(self.parent, "db_path", None)
+        if old_db_path and old_db_path != db_path:
+            helper_functions.close_database(old_db_path)
+        # the path -> row id index is rebuilt from the (possibly new or recreated) database on the next drop
+        helper_functions.clear_path_index(db_path)
+
         self.parent.db_path = db_path
 
         if os.path.isfile(db_path):
             self.parent.setWindowTitle(f"ToothSeeker   -   {db_name}")
             # open a new tab with the image drop widget for the new database
-            self.parent.open_new_imagedrop_tab()
+            if defer_tab:
+                QTimer.singleShot(0, self.parent.open_new_imagedrop_tab)
+            else:
+                self.parent.open_new_imagedrop_tab()
         else:
             self.database_not_found_warning(db_path)
             self.parent.setWindowTitle(f"ToothSeeker   -   {db_name}   <-- (Not found in current folder - please select an existing database or create a new one)")
@@ -93,7 +120,7 @@ class DatabaseMenu:
         print(f"NOTE: Configured database '{db_path}' does not exist in the current folder. Please select an existing database or create a new one.")
         msg = QMessageBox(parent)
         msg.setIcon(QMessageBox.Information)
-        msg.setWindowIcon(QtGui.QIcon('icon.png'))
+        msg.setWindowIcon(get_warning_icon())
         msg.setWindowTitle("Configured Database Not Found")
         #msg.setInformativeText(f"The configured database '{db_path}' does not exist in the current folder.\n\nPlease select an existing database, or create a new one.")
         msg.setText(f"The configured database '{db_path}' used previously does not exist in the current folder.\n\nPlease select an existing database, or create a new one.")
@@ -102,16 +129,11 @@ class DatabaseMenu:
 
     def update_config_file(self, new_db_path):
         """used to update the new chosen database into the config file"""
-        config = configparser.ConfigParser()
-        #config.read('config.ini') # Read the existing config file
-        config_file_path = self.get_config_file_path()
-        config.read(config_file_path)
-        config.set('database', 'db_path', new_db_path) # Update an existing key's value
-        #with open('config.ini', 'w') as f: # Write the updated config object to the file
-        #    config.write(f)
-        with open(config_file_path, 'w') as f: # Write the updated config object to the file
-            config.write(f)
-        print(f"Updated config file '{config_file_path}' with newly selected database: '{new_db_path}'")
+        # update the cached config in place (it was read from the file in __init__), then write it out once
+        self._config.set('database', 'db_path', new_db_path) # Update an existing key's value
+        with open(self._config_path, 'w') as f: # Write the updated config object to the file
+            self._config.write(f)
+        print(f"Updated config file '{self._config_path}' with newly selected database: '{new_db_path}'")
 
     def create_new_database(self):
         # Create a new dialog window
@@ -172,7 +194,7 @@ class DatabaseMenu:
 
     def select_existing_database(self):
         # Open file explorer to choose a file
-        file_path, _ = QFileDialog.getOpenFileName(self.parent, "Select database file", "", "Database Files (*.db)")
+        file_path, _ = QFileDialog.getOpenFileName(self.parent, "Select database file", "", "Database Files (*.db)", options=FAST_FILE_DIALOG_OPTIONS | QFileDialog.ReadOnly)
         
         if file_path:
             #absolute_path = os.path.abspath(file_path)
@@ -191,7 +213,7 @@ class DatabaseMenu:
             self.update_config_file(base_name)
 
     def open_directory_dialog(self, edit):
-        directory = QFileDialog.getExistingDirectory(self.parent, "Select directory")
+        directory = QFileDialog.getExistingDirectory(self.parent, "Select directory", options=FAST_FILE_DIALOG_OPTIONS | QFileDialog.ShowDirsOnly)
         if directory:
             edit.setText(directory)
 
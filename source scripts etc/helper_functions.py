@@ -7,14 +7,21 @@ from numpy import random
 import os
 import sys
 import platform
+import functools
+from pathlib import Path
+from types import MappingProxyType
 from datetime import datetime
 
 from PyQt5.QtWidgets import QLabel, QVBoxLayout, QPushButton, QDialog, QLineEdit, QHBoxLayout
 from PyQt5.QtGui import QRegExpValidator
 from PyQt5.QtCore import Qt, QRegExp
 
+# accepted input of the row id dialog (shared by all dialogs, compiled once)
+_ROW_ID_REGEXP = QRegExp(r'\d+')
+
+@functools.lru_cache(maxsize=1)
 def get_project_root():
-    """Returns project root folder."""
+    """Returns project root folder. (Cached, as the answer never changes while the program is running.)"""
     if getattr(sys, 'frozen', False):
         # The application is bundled with PyInstaller
         if platform.system() == 'Darwin':
@@ -29,48 +36,113 @@ def get_project_root():
     #print(f"debug - app_dir by get_project_root: {app_dir}")
     return app_dir
 
+@functools.lru_cache(maxsize=256)
 def get_absolute_path(local_path):
     '''Returns the correct path to the given local path, depending on whether the application is running as a script or as a bundled executable.'''
+    # already absolute (e.g. the db_path stored at the main window) - nothing to do
+    if os.path.isabs(local_path):
+        return local_path
     app_dir = get_project_root()
     #print(f"debug - path given as argument to get_correct_path: {local_path}")
-    absolute_path = os.path.join(app_dir, local_path)
+    # app_dir is already absolute, so normpath (pure string operation) is enough here - no need for abspath and its getcwd call
+    absolute_path = os.path.normpath(os.path.join(app_dir, local_path))
     #print(f"debug - correct_path after joining with app_dir: {correct_path}")
 
     return absolute_path
 
-def connect_to_database(db_name):
-    '''Connects to the database and returns the connection and cursor objects.'''
+# open connections by (absolute database path, read_only) (reused by connect_to_database, closed by close_database)
+_CONN_CACHE = {}
+
+def connect_to_database(db_name, read_only=False):
+    '''Connects to the database and returns the connection and cursor objects.
+    The connection is kept open and reused for the same database, so callers should not close it (use close_database instead).
+    With `read_only=True` the database is opened in read-only mode (separate connection, skips the write/journal checks).'''
 
     db_path = get_absolute_path(db_name)
+    cache_key = (db_path, read_only)
+
+    conn = _CONN_CACHE.get(cache_key)
+    if conn is not None:
+        try:
+            conn.total_changes # raises if the connection has been closed
+            return conn, conn.cursor()
+        except sqlite3.ProgrammingError:
+            del _CONN_CACHE[cache_key]
 
     if not os.path.isfile(db_path):
         print(f"Note: Configured database '{db_name}' does not exist. Please select an existing database or create a new one.\n")
         return None, None
     else:
-        conn = sqlite3.connect(db_path)
+        if read_only:
+            conn = sqlite3.connect(f"{Path(db_path).as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+        _CONN_CACHE[cache_key] = conn
         c = conn.cursor()
         return conn, c
 
+def close_database(db_name):
+    '''Closes the cached connections to the database (if any), e.g. when the database is changed.'''
+    db_path = get_absolute_path(db_name)
+    for read_only in (False, True):
+        conn = _CONN_CACHE.pop((db_path, read_only), None)
+        if conn is not None:
+            conn.close()
+
+# image path -> row id lookup tables by absolute database path (built on first use by get_rowid_by_path)
+_PATH_INDEX = {}
+
+def get_rowid_by_path(db_path, image_path):
+    '''Returns the id of the row with the given image path, or None if there is no such row.
+    All paths of the database are read into a dictionary on the first call, so later lookups need no queries.'''
+    index_key = get_absolute_path(db_path)
+    path_index = _PATH_INDEX.get(index_key)
+    if path_index is None:
+        conn, c = connect_to_database(db_path, read_only=True)
+        c.execute('SELECT id, path FROM images')
+        path_index = {path: row_id for row_id, path in c}
+        _PATH_INDEX[index_key] = path_index
+    return path_index.get(image_path)
+
+def clear_path_index(db_path):
+    '''Forgets the path index of the database (e.g. when the database is selected or created again).'''
+    _PATH_INDEX.pop(get_absolute_path(db_path), None)
+
 def check_database_max_row(db_path):
-    conn, c = connect_to_database(db_path)
+    conn, c = connect_to_database(db_path, read_only=True)
     if not conn:
         print(f"Could not connect to database '{db_path}'\n")
         return None
-    c.execute('SELECT COUNT(*) FROM images')
-    max_row = c.fetchone()[0]
-    conn.close()
-    return max_row
+    return _max_row(c)
+
+def _max_row(c):
+    # largest id (a lookup on the primary key, unlike COUNT(*) which scans the table)
+    c.execute('SELECT MAX(id) FROM images')
+    return c.fetchone()[0]
 
 def row_exists_in_database(db_path, row_id):
-    conn, c = connect_to_database(db_path)
-    c.execute('SELECT 1 FROM images WHERE rowid=?', (row_id,))
-    row_exists = c.fetchone() is not None
-    conn.close()
-    return row_exists
+    conn, c = connect_to_database(db_path, read_only=True)
+    return _row_exists(c, row_id)
+
+def _row_exists(c, row_id):
+    c.execute('SELECT 1 FROM images WHERE rowid=? LIMIT 1', (row_id,))
+    return c.fetchone() is not None
+
+def get_random_row_id(c, max_row):
+    '''Returns the id of a random existing row (using the given cursor object `c`), using a single query on the (indexed) id column instead of retrying random ids.
+    If the random id has been removed (e.g. as a duplicate), the next existing id is used, wrapping around to the first one.'''
+    c.execute('SELECT id FROM images WHERE id >= ? ORDER BY id LIMIT 1', (int(random.randint(1, max_row + 1)),))
+    row = c.fetchone()
+    if row is None:
+        c.execute('SELECT id FROM images ORDER BY id LIMIT 1')
+        row = c.fetchone()
+    return row[0] if row else None
 
 def save_input_value(value, input_window, db_path, row_id_ref):
-    
-    max_row = check_database_max_row(db_path)
+
+    # one connection (and cursor) for all the queries below
+    conn, c = connect_to_database(db_path, read_only=True)
+    max_row = _max_row(c) if conn else None
     if not max_row:
         print(f"Error: No max row found for database '{db_path}' - does the database exist?\n")
         print(f"Closing input window...\n")
@@ -80,15 +152,13 @@ def save_input_value(value, input_window, db_path, row_id_ref):
     value = int(value)
 
     if value == 0:
-        while True:
-            random_id = random.randint(1, max_row)
-            if row_exists_in_database(db_path, random_id):
-                row_id_ref[0] = random_id
-                print(f'Randomized row id (1...{max_row}): {random_id}\n')
-                break
+        random_id = get_random_row_id(c, max_row)
+        if random_id is not None:
+            row_id_ref[0] = random_id
+            print(f'Randomized row id (1...{max_row}): {random_id}\n')
     elif value > max_row:
         print(f"Given row id {value} > {max_row} (the largest row id in the database '{db_path}'). Please try another.\n")
-    elif row_exists_in_database(db_path, value):
+    elif _row_exists(c, value):
         row_id_ref[0] = value
         print(f'Given base image row id: {row_id_ref[0]}\n')
     else:
@@ -106,7 +176,7 @@ def ask_row_id(db_path, parent=None):
     input_window.setModal(True)
 
     input_box = QLineEdit(input_window)
-    input_box.setValidator(QRegExpValidator(QRegExp('\d+'), input_box))
+    input_box.setValidator(QRegExpValidator(_ROW_ID_REGEXP, input_box))
     input_box.textChanged.connect(lambda: ok_button.setEnabled(input_box.hasAcceptableInput()))
 
     button_layout = QHBoxLayout()
@@ -128,71 +198,44 @@ def ask_row_id(db_path, parent=None):
     return row_id_ref[0]
 
 
+# parameter names and their full names (read-only, built once at import)
+_PARAM_NAMES = MappingProxyType({'iter': 'iterations', 'Egr': 'Epithelial proliferation rate', 'Mgr': 'Mesenchymal proliferation rate', 
+                               'Rep': "Young's modulus (stiffness)", 'Swi': 'Distance from 0 where the borders are defined', 
+                               'Adh': 'Traction between neighbours', 'Act': 'Activator auto-activation', 'Inh': 'Inhibition of activator', 
+                               'Sec': 'Growth factor secretion rate', 'Da': 'Activator diffusion rate', 'Di': 'Inhibitor diffusion rate', 
+                               'Ds': 'Growth factor diffusion rate', 'Int': 'Initial inhibitor threshold.', 'Set': 'Growth factor threshold', 
+                               'Boy': 'Mesenchyme mechanic resistance', 'Dff': 'Differentiation rate', 'Bgr': 'Border growth, amount of mes. in ant.-post.', 
+                               'Abi': 'Anterior bias', 'Pbi': 'Posterior bias', 'Lbi': 'Lingual bias', 'Bbi': 'Buccal bias', 'Rad': 'Radius of initial conditions', 
+                               'Deg': 'Protein degradation rate', 'Dgr': 'Downward vector of growth', 'Ntr': 'Mechanical traction from the borders to the nucleus', 
+                               'Bwi': 'Width of border', 'Ina': 'Initial activator concentration', 'uMgr': 'Basal mesenchymal proliferation rate'})
+
 def create_param_name_dict():
-    '''Creates a dictionary of param_name and their full names. (e.g. 'Bbi': 'Buccal bias')
-    Returns the dictionary.'''
-    
-    param_name_dict = {'iter': 'iterations', 'Egr': 'Epithelial proliferation rate', 'Mgr': 'Mesenchymal proliferation rate', 
-                    'Rep': "Young's modulus (stiffness)", 'Swi': 'Distance from 0 where the borders are defined', 
-                    'Adh': 'Traction between neighbours', 'Act': 'Activator auto-activation', 'Inh': 'Inhibition of activator', 
-                    'Sec': 'Growth factor secretion rate', 'Da': 'Activator diffusion rate', 'Di': 'Inhibitor diffusion rate', 
-                    'Ds': 'Growth factor diffusion rate', 'Int': 'Initial inhibitor threshold.', 'Set': 'Growth factor threshold', 
-                    'Boy': 'Mesenchyme mechanic resistance', 'Dff': 'Differentiation rate', 'Bgr': 'Border growth, amount of mes. in ant.-post.', 
-                    'Abi': 'Anterior bias', 'Pbi': 'Posterior bias', 'Lbi': 'Lingual bias', 'Bbi': 'Buccal bias', 'Rad': 'Radius of initial conditions', 
-                    'Deg': 'Protein degradation rate', 'Dgr': 'Downward vector of growth', 'Ntr': 'Mechanical traction from the borders to the nucleus', 
-                    'Bwi': 'Width of border', 'Ina': 'Initial activator concentration', 'uMgr': 'Basal mesenchymal proliferation rate'}
+    '''Returns a (read-only) dictionary of param_name and their full names. (e.g. 'Bbi': 'Buccal bias')'''
     
-    return param_name_dict
+    return _PARAM_NAMES
 
 
+# columns written by export_row_to_file, in the order of the ToothMaker parameter files:
+# non-parameter keywords of the header section, and the parameters
+_HEADER_KEYS = ('model', 'viewthresh', 'viewmode', 'iter')
+_PARAM_KEYS = ('Egr', 'Mgr', 'Rep', 'Swi', 'Adh', 'Act', 'Inh', 'Sec', 'Da', 'Di', 'Ds', 'Int', 'Set', 'Boy',
+               'Dff', 'Bgr', 'Abi', 'Pbi', 'Lbi', 'Bbi', 'Rad', 'Deg', 'Dgr', 'Ntr', 'Bwi', 'Ina')
+
+# number of rows fetched (and ids bound to a single query) at a time by export_rows_to_files
+_EXPORT_BATCH_SIZE = 256
+
 def export_row_to_file(db_path, row_id):
     """Exports the parameters of a database row into a text file, which can be imported into ToothMaker."""
+    export_rows_to_files(db_path, [row_id])
 
-    # Connect to the database
-    conn, c = connect_to_database(db_path)
-
-    # Query the database for the row with the given ID
-    c.execute(f"SELECT * FROM images WHERE id=?", (int(row_id),))
-    row = c.fetchone()
+def export_rows_to_files(db_path, row_ids):
+    """Exports the parameters of the given database rows into text files (one file per row), which can be imported into ToothMaker.
+    All rows are fetched with the same connection, a batch of ids per query."""
 
-    # Check if the row was found
-    if row is None:
-        print(f"No row with ID {row_id} found in table 'images' of database '{db_path}'.")
-        return
+    row_ids = [int(row_id) for row_id in row_ids]
 
-    # Create a dictionary with parameter names and values
-    params = {
-        "model": row[2],
-        "viewthresh": row[3],
-        "viewmode": row[4],
-        "iter": row[5],
-        "Egr": row[6],
-        "Mgr": row[7],
-        "Rep": row[8],
-        "Swi": row[9],
-        "Adh": row[10],
-        "Act": row[11],
-        "Inh": row[12],
-        "Sec": row[13],
-        "Da": row[14],
-        "Di": row[15],
-        "Ds": row[16],
-        "Int": row[17],
-        "Set": row[18],
-        "Boy": row[19],
-        "Dff": row[20],
-        "Bgr": row[21],
-        "Abi": row[22],
-        "Pbi": row[23],
-        "Lbi": row[24],
-        "Bbi": row[25],
-        "Rad": row[26],
-        "Deg": row[27],
-        "Dgr": row[28],
-        "Ntr": row[29],
-        "Bwi": row[30],
-        "Ina": row[31]
-    }
+    # Connect to the database
+    conn, c = connect_to_database(db_path)
 
     # Create the 'exported_parameters' folder if it doesn't exist
     #if not os.path.exists('exported_parameters'):
@@ -202,30 +245,41 @@ def export_row_to_file(db_path, row_id):
     if not os.path.exists(exported_parameter_folder_path):
         os.makedirs(exported_parameter_folder_path)
 
-    # Create the output file path
+    # (the same timestamp for all files of this export)
     timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-    output_file_name = f"id-{row_id}___{os.path.basename(db_path)}___{timestamp}.txt"
-    output_file_path = os.path.join(exported_parameter_folder_path, output_file_name)
-
-    # Write the parameters to the output file
-    with open(output_file_path, "w", newline='\n') as file:
-        file.write("# Model parameters file generated by Toothseeker! (in style of ones created by MorphoMaker 0.6.4.)\n")
-        file.write("# NOTE: Parameter names are case-sensitive, while non-parameter keywords\n")
-        file.write("# (e.g. model, viewtresh) are case-insensitive!\n\n")
 
-        file.write("# Model name, view threshold, view mode, iterations.\n")
-        file.write(f"model=={params['model']}\n")
-        file.write(f"viewthresh=={params['viewthresh']}\n")
-        file.write(f"viewmode=={params['viewmode']}\n")
-        file.write(f"iter=={params['iter']}\n\n")
+    # Query the database for the rows with the given IDs (rows as sqlite3.Row, so that columns can be accessed by name)
+    c.row_factory = sqlite3.Row
+    exported_ids = set()
+    for batch_start in range(0, len(row_ids), _EXPORT_BATCH_SIZE):
+        batch_ids = row_ids[batch_start:batch_start + _EXPORT_BATCH_SIZE]
+        c.execute(f"SELECT * FROM images WHERE id IN ({','.join('?' * len(batch_ids))})", batch_ids)
+        while rows := c.fetchmany(_EXPORT_BATCH_SIZE):
+            for row in rows:
+                # Create the output file path
+                output_file_name = f"id-{row['id']}___{os.path.basename(db_path)}___{timestamp}.txt"
+                output_file_path = os.path.join(exported_parameter_folder_path, output_file_name)
+                write_parameter_file(row, output_file_path)
+                exported_ids.add(row['id'])
+                print(f"Parameters of row {row['id']} from database '{db_path}' successfully exported to '{output_file_path}'.")
+
+    # Check if all rows were found
+    for row_id in row_ids:
+        if row_id not in exported_ids:
+            print(f"No row with ID {row_id} found in table 'images' of database '{db_path}'.")
+
+def write_parameter_file(row, output_file_path):
+    """Writes the parameters of a database row (accessible by column name, e.g. sqlite3.Row) into a ToothMaker parameter file."""
+
+    # Collect the contents of the file, then write them all at once
+    header = ("# Model parameters file generated by Toothseeker! (in style of ones created by MorphoMaker 0.6.4.)\n"
+              "# NOTE: Parameter names are case-sensitive, while non-parameter keywords\n"
+              "# (e.g. model, viewtresh) are case-insensitive!\n\n"
+              "# Model name, view threshold, view mode, iterations.\n"
+              + ''.join(f"{key}=={row[key]}\n" for key in _HEADER_KEYS)
+              + "\n# Parameters.\n")
+    parameters = ''.join(f"{param}=={row[param]}\n" for param in _PARAM_KEYS)
 
-
-        file.write("# Parameters.\n")
-        for param, value in params.items():
-            if param not in {'model', 'viewthresh', 'viewmode', 'iter'}:
-                file.write(f"{param}=={value}\n")
-
-    # Close the database connection
-    conn.close()
-
-    print(f"Parameters of row {row_id} from database '{db_path}' successfully exported to '{output_file_path}'.")
\ No newline at end of file
+    # Write the parameters to the output file
+    with open(output_file_path, "w", newline='\n', buffering=65536) as file:
+        file.write(header + parameters)
@@ -6,6 +6,7 @@ based on imagedropwidget.py
 
 import os
 import sys
+import functools
 from PyQt5.QtWidgets import QWidget, QLabel, QVBoxLayout
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt, pyqtSignal
@@ -14,6 +15,14 @@ from PyQt5.QtCore import Qt, pyqtSignal
 import helper_functions
 
 
+@functools.lru_cache(maxsize=16)
+def _export_root_basename(example_path):
+    '''Returns the name of the folder containing the ToothMaker export folders,
+    e.g. 'exports_example' from 'exports_example\\\\example_scan_1\\\\screenshots\\\\ToothMaker_0000_0000009000.png'.'''
+    parts = [part for part in example_path.replace('\\', '/').split('/') if part]
+    return parts[-4] if len(parts) >= 4 else ''
+
+
 class ImageDropWidgetSimple(QWidget):
     """A widget that accepts just drag-and-drop events and then opens new tab in MainWindow"""
 
@@ -29,16 +38,25 @@ class ImageDropWidgetSimple(QWidget):
         # will store the id of the dropped or selected image file, or id given by user input
         self.given_row_id = None
 
-        # get path of the first image in the database, to be used as example
-        conn, c = helper_functions.connect_to_database(db_path)
-        example_path = self.get_example_path(conn)
-        conn.close()
+        # directory that the dropped image paths are made relative to (resolved once here instead of on every drop)
+        if getattr(sys, 'frozen', False):
+            # If the script is bundled into an executable using PyInstaller - paths relative to the .exe file (ToothSeeker_v1.exe)
+            self._base_dir = os.path.dirname(sys.executable)
+        else:
+            # If the script is run directly - paths relative to the script
+            self._base_dir = os.path.dirname(os.path.abspath(__file__))
+
+        # path separator used in the database paths: the databases created on Windows store the paths with double backslashes
+        self._db_sep = '\\\\' if os.sep == '\\' else '/'
+
+        # path of the first image in the database, to be used as example (fetched lazily when the widget is first shown)
+        self._example_path = None
 
         # Create a QLabel widget to display the image
         self.image_label = QLabel(self)
         self.image_label.setGeometry(0, 0, self.width(), self.height())
         self.image_label.setAlignment(Qt.AlignCenter)
-        self.image_label.setText(f"Create a new view tab\nfrom the menu above\n\n\n- - -  or  - - -\n\n\nDrag and drop here\nany ToothMaker output screenshot\nthat was included in the creation\nof the currently selected database\n'{db_path}'\n\n(i.e. screenshot inside the folder '{os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(example_path))))}')\n\nExample screenshot from the database:\n'{example_path}'")
+        self.image_label.setText(self.create_label_text())
 
         self.image_label.setFont(QFont('Courier', 10))
 
@@ -49,13 +67,31 @@ class ImageDropWidgetSimple(QWidget):
         # Enable drag-and-drop events for the widget
         self.setAcceptDrops(True)
 
+    def create_label_text(self, example_path=None):
+        '''Returns the instruction text of the widget, including the example path if given.'''
+        text = f"Create a new view tab\nfrom the menu above\n\n\n- - -  or  - - -\n\n\nDrag and drop here\nany ToothMaker output screenshot\nthat was included in the creation\nof the currently selected database\n'{self.db_path}'"
+        if example_path is not None:
+            text += f"\n\n(i.e. screenshot inside the folder '{_export_root_basename(example_path)}')\n\nExample screenshot from the database:\n'{example_path}'"
+        return text
+
+    def _lazy_populate_example(self):
+        '''Fetches the example path from the database and adds it to the label (deferred from __init__ to keep the database access off the window construction).'''
+        conn, c = helper_functions.connect_to_database(self.db_path)
+        self._example_path = self.get_example_path(conn)
+        self.image_label.setText(self.create_label_text(self._example_path))
+
+    def showEvent(self, event):
+        # fill in the example path when the widget is shown for the first time
+        if self._example_path is None:
+            self._lazy_populate_example()
+        super().showEvent(event)
+
     def dragEnterEvent(self, event):
-        # Check if the dropped item is a PNG image file
+        # Check if the dropped item is a PNG image file (by the file name of the url only - the local path is needed just in dropEvent)
         if event.mimeData().hasUrls():
-            for url in event.mimeData().urls():
-                if url.isLocalFile() and url.toLocalFile().endswith('.png'):
-                    event.accept()
-                    return
+            if any(url.isLocalFile() and url.fileName().lower().endswith('.png') for url in event.mimeData().urls()):
+                event.accept()
+                return
         print("Not a .png image file.\n")
         #self.image_label.setText("Not a .png image file.")
         event.ignore()
@@ -63,7 +99,7 @@ class ImageDropWidgetSimple(QWidget):
     def dropEvent(self, event):
         # Get the path of the dropped PNG image file
         for url in event.mimeData().urls():
-            if url.isLocalFile() and url.toLocalFile().endswith('.png'):
+            if url.isLocalFile() and url.fileName().lower().endswith('.png'):
                 image_path = url.toLocalFile()
                 self.process_image(image_path)
                 event.accept()
@@ -83,46 +119,41 @@ class ImageDropWidgetSimple(QWidget):
         return example_path
 
     def get_rowid_from_path(self, db_path, image_path):
-        '''Connects to the SQLite database located at `db_path`. 
+        '''Looks up the image located at `image_path` from the SQLite database located at `db_path` (via the in-memory path index of helper_functions). 
         Returns the rowid of the image located at `image_path`.'''
-        conn, c = helper_functions.connect_to_database(db_path)
         print(f"Looking for image path: {image_path} in database '{db_path}'.")
-        c.execute('SELECT id FROM images WHERE path = ?', (image_path,))
-        try:
-            rowid = c.fetchone()[0]
+        rowid = helper_functions.get_rowid_by_path(db_path, image_path)
+        if rowid is not None:
             print(f"\nImage path '{image_path}' found in database '{db_path}'.\nRow id: {rowid}\n")
-        except TypeError:
+        else:
             print(f"\nImage path '{image_path}' not found in database '{db_path}'.\n")
+            conn, c = helper_functions.connect_to_database(db_path)
             example_path = self.get_example_path(conn)
             print(f"Example path of an image from the database '{db_path}':\n'{example_path}'\n(^ ^ ^ Note the folder containing the export folders at the start of the path!)\n")
-            print(f"It's also possible the image was removed as a duplicate (see '{db_path}___removed_duplicates___<datetime>.csv').\n")
+            print(f"It's also possible the image was removed as a duplicate (see '{db_path}___removed_duplicates___<datetime>.csv', or .csv.gz for large ones).\n")
             rowid = None
-        conn.close()
         return rowid
 
     def process_image(self, image_path):
         '''Processes the image located at `image_path`.'''
 
         print(f"\nReceived PNG image path: {image_path}\n")
-        absolute_path = os.path.abspath(image_path)
+        # (the path given by Qt is already absolute, so normpath is enough - no need for abspath)
+        absolute_path = os.path.normpath(image_path)
         #print(f"Absolute path: {absolute_path}")
 
         if getattr(sys, 'frozen', False):
-            # If the script is bundled into an executable using PyInstaller - get relative path to the .exe file (ToothSeeker_v1.exe)
-            exe_directory = os.path.dirname(sys.executable)
-            print(f".exe directory: {exe_directory}")
+            print(f".exe directory: {self._base_dir}")
             # Calculate the relative path of the image to the .exe file
-            relative_path = os.path.relpath(absolute_path, exe_directory)
+            relative_path = os.path.relpath(absolute_path, self._base_dir)
             print(f"Relative path (to .exe): {relative_path}\n")
         else:
-            # If the script is run directly - get relative path to the script
-            start_directory = os.path.abspath(os.path.dirname(__file__))
-            print(f"Script directory: {start_directory}")
-            relative_path = os.path.relpath(absolute_path, start_directory) # TODO - this caused some problems earlier when called by the exe on a university computer, in style of "ValueError: path is on mount '<some network stuff I dunno>', start on mount 'C:'"
+            print(f"Script directory: {self._base_dir}")
+            relative_path = os.path.relpath(absolute_path, self._base_dir) # TODO - this caused some problems earlier when called by the exe on a university computer, in style of "ValueError: path is on mount '<some network stuff I dunno>', start on mount 'C:'"
             print(f"Relative path (to __file__): {relative_path}\n")
 
-        # Replace the backslashes with double backslashes (to match the format in the database)
-        relative_path_with_double_backslashes = r"{}".format(relative_path).replace('\\', '\\\\')
+        # Replace the path separators with the ones used in the database (on Windows: double backslashes)
+        relative_path_with_double_backslashes = relative_path.replace(os.sep, self._db_sep)
         #print(f"Relative path with double backslashes: {relative_path_with_double_backslashes}")
         #print(r"(path-values in the database are in style of: exports\\export_1\\screenshots\\ToothMaker_0780_0000009000.png)")
 
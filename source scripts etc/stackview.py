@@ -5,17 +5,55 @@ stacker.py refactored as a class StackView
 import os
 import sys
 import platform
+import bisect
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import pandas as pd
 import pyqtgraph as pg
 from PIL import Image
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QMenu, QGridLayout, QVBoxLayout, QDialog, QMainWindow, QRadioButton, QButtonGroup
 from PyQt5.QtGui import QFont
 
+# optional faster PNG decoder (OpenCV), PIL is used if it is not installed
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
 # own modules:
 import helper_functions
 #import n_hotkey
 
+def _load_image(path):
+    '''Loads the image at `path`, transposed 90 degrees clockwise (to get the tooth images straight).
+    Uses OpenCV if available (and able to read the path), PIL otherwise.
+    Returns the image as a C-contiguous numpy array of shape (width, height, channels).'''
+
+    if cv2 is not None:
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is not None and img.ndim == 3:
+            # OpenCV reads the channels as BGR(A)
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA if img.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+            return cv2.transpose(img)
+    # PIL writes the transposed result contiguously
+    return np.asarray(Image.open(path).transpose(Image.Transpose.TRANSPOSE))
+
+
+def neighbor_counts(params, target_rows):
+    '''Counts the neighbors of the rows `target_rows` of the 2D array `params`, i.e. the rows that differ from the target row in exactly one column.
+    Returns an array of shape (len(target_rows), number of columns), where element [i, j] is the number of rows differing from row target_rows[i] only by column j.'''
+
+    counts = np.zeros((len(target_rows), params.shape[1]), dtype=np.int32)
+    for i, target in enumerate(target_rows):
+        # one pass over all the rows: mark the differing columns, and credit the rows with a single difference to that column
+        differs = params != params[target]
+        single_diff = np.count_nonzero(differs, axis=1) == 1
+        counts[i] = np.bincount(differs[single_diff].argmax(axis=1), minlength=params.shape[1])
+
+    return counts
+
+
 class StackView(QWidget):
     """A widget that displays a stack of images, each of which is a row in the database table 'images'."""
 
@@ -33,78 +71,85 @@ class StackView(QWidget):
         
         self.row_id = row_id
 
+        # Read the whole images table once; all the lookups of the view are done on this DataFrame instead of separate queries
+        self.df = pd.read_sql_query("SELECT * FROM images", self.conn).set_index('id', drop=False)
+
+        # encoded parameter matrix of the table (computed on first need), and the parameter value strings and neighbor counts per row_id
+        # (independent of the chosen parameter, so the counts of the pick dialog are reused by the view)
+        self._param_matrix = None
+        self._nb_cache = {}
+
         if not chosen_param:
-            self.chosen_param = self.show_pick_axis_param_option_window(self.c, self.row_id, old_chosen_param)
+            self.chosen_param = self.show_pick_axis_param_option_window(self.row_id, old_chosen_param)
         else:
             self.chosen_param = chosen_param
 
-        self.init_ui(self.c, self.row_id, self.chosen_param)
+        self.init_ui(self.row_id, self.chosen_param)
 
 
     # -------- ... (all other methods remain the same, just change their names to be methods of the class): -----------
 
-    def check_if_row_id_exists(self, c, row_id):
-        '''Checks if `row_id` exists in the images table using the given cursor object `c`.
+    def check_if_row_id_exists(self, row_id):
+        '''Checks if `row_id` exists in the images table.
         Returns `True` if the row exists, `False` otherwise.'''
 
-        c.execute("SELECT * FROM images WHERE id=?", (int(row_id),))
-        return bool(c.fetchone())
+        return int(row_id) in self.df.index
 
-    def check_if_chosen_param_exists(self, c, chosen_param):
-        '''Checks if `chosen_param` exists in the images table using the given cursor object `c`.
+    def check_if_chosen_param_exists(self, chosen_param):
+        '''Checks if `chosen_param` exists in the images table.
         Returns `True` if the column exists, `False` otherwise.'''
 
-        all_column_names = [description[0] for description in c.description]
-        return chosen_param in all_column_names and chosen_param not in ['id', 'path']
+        return chosen_param in self.df.columns and chosen_param not in ['id', 'path']
 
-    def find_rows_differing_by_param(self, c, row_id: int, chosen_param: str):
-        '''Finds rows in the 'images' table that differ from the row with id `row_id` _only_ by the chosen parameter.
-        Returns the base_row and a list of tuples (representing the rows satisfying the properties).'''
+    def find_rows_differing_by_param(self, base, row_id: int, chosen_param: str):
+        '''Finds rows in the 'images' table that differ from the row with id `row_id` (given as the Series `base`, fetched once by the caller) _only_ by the chosen parameter.
+        Returns the base_row and a list of tuples (representing the rows satisfying the properties, sorted by chosen_param), with only the columns (id, path, chosen_param).'''
 
-        # Fetch the base row
-        c.execute("SELECT * FROM images WHERE id=?", (int(row_id),))
-        base_row = c.fetchone()
+        # only the columns used for stacking are returned
+        output_columns = ['id', 'path', chosen_param]
 
-        all_column_names = [description[0] for description in c.description]
-        column_indices = [i for i in range(len(all_column_names)) if all_column_names[i] not in ['id', 'path', chosen_param]]
-        column_values = [base_row[i] for i in column_indices]
-        query_params = tuple([int(row_id), base_row[all_column_names.index(chosen_param)]] + column_values)
-        query_string = F"SELECT * FROM images WHERE id != ? AND `{chosen_param}` != ? AND " + " AND ".join([f"`{all_column_names[i]}` = ?" for i in column_indices])
-        #print(f"query_string: {query_string}")
-        #print(f"query_params: {query_params}")
-        c.execute(query_string, query_params)
-        rows = c.fetchall()
+        base_row = tuple(base[output_columns])
+
+        # NULLs never match, as in an SQL comparison
+        if pd.isna(base[chosen_param]):
+            return base_row, []
+
+        # A single mask over the table: same values in all the other columns, a different value of chosen_param
+        equal_columns = [col for col in self.df.columns if col not in ['id', 'path', chosen_param]]
+        mask = (self.df[equal_columns] == base[equal_columns]).all(axis=1) & (self.df[chosen_param] != base[chosen_param]) & self.df[chosen_param].notna() & (self.df.index != int(row_id))
+        rows = list(self.df.loc[mask, output_columns].sort_values(chosen_param, kind='stable').itertuples(index=False, name=None))
 
         return base_row, rows
 
-    def stack_images(self, c, base_row, rows, chosen_param):
-        '''Stacks PNG images into a 3D numpy array.
+    def stack_images(self, base_row, rows):
+        '''Stacks PNG images into a 3D numpy array, given rows of (id, path, chosen_param) as returned by find_rows_differing_by_param.
         Returns the 3D numpy array, array of the image ids, and array of chosen_param column values in sorted order.'''
 
         # to make this work also on macOS:
         app_dir = helper_functions.get_project_root()
 
-        images = []
-        all_column_names = [description[0] for description in c.description]
-        #print(all_column_names)
-        for row in [base_row] + rows:
-            #img_path = os.path.join(row[1])
-            img_path = os.path.join(app_dir, row[1])
-            #print(row)
-            #print(img_path)
-            img = np.array(Image.open(img_path))
-            img = img.transpose((1, 0, 2))  # Transpose the images 90 degrees clockwise to get them straight
-            img_id = row[all_column_names.index('id')]
-            chosen_param_value = row[all_column_names.index(chosen_param)]
-            #images.append((img, chosen_param_value))
-            images.append((img, img_id, chosen_param_value))
-        images.sort(key=lambda x: x[2])
-        arr = np.stack([img for img, _, _ in images], axis=0)
+        # The rows come sorted by chosen_param, so only the base row is inserted at its place (before loading the images, so that each image can be decoded straight into its place in the stack)
+        sorted_rows = list(rows)
+        sorted_rows.insert(bisect.bisect_left([row[2] for row in rows], base_row[2]), base_row)
+        #img_paths = [os.path.join(row[1]) for row in sorted_rows]
+        img_paths = [os.path.join(app_dir, row[1]) for row in sorted_rows]
+
+        # Load the first image to get the shape of the stack, and preallocate the stack
+        first_img = _load_image(img_paths[0])
+        arr = np.empty((len(img_paths),) + first_img.shape, dtype=first_img.dtype)
+        arr[0] = first_img
+
+        def load_image(index):
+            arr[index] = _load_image(img_paths[index])
+
+        # Decode the rest of the images in parallel (both decoders release the GIL while decoding)
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            list(executor.map(load_image, range(1, len(img_paths))))
 
         # Get values of chosen_param in sorted order
-        chosen_param_values = np.array([val for _, _, val in images])
+        chosen_param_values = np.array([row[2] for row in sorted_rows])
         # Get image ids in sorted order
-        img_ids = np.array([val for _, val, _ in images])
+        img_ids = np.array([row[0] for row in sorted_rows])
 
         return arr, img_ids, chosen_param_values
 
@@ -124,7 +169,7 @@ class StackView(QWidget):
 
         return view
 
-    def create_info_labels(self, c, view, img_ids, chosen_param_values, chosen_param,  my_font = QFont('Courier', 10)):
+    def create_info_labels(self, view, img_ids, chosen_param_values, chosen_param,  my_font = QFont('Courier', 10)):
         """Creates labels for showing the current image id and chosen_param value, and the values and counts of neighbors for each parameter.
         Returns the position_label, param_value_labels, and param_count_labels."""
         # ------------------ Create label for showing the current image id and chosen_param value ------------------
@@ -146,22 +191,21 @@ class StackView(QWidget):
         nb_count_labels = [QLabel(f" ") for _ in range(5,33)]
         
         # create lists of strings for the side labels, len(list) = len(img_ids)
-        param_value_strings_per_img, nb_count_strings_per_img = self.create_param_info_per_slider_index(c, img_ids, chosen_param)
-
-        # for updating the label columns
-        def update_labels(index, param_value_strings_per_img, nb_count_strings_per_img, param_value_labels, nb_count_labels):
-            [label.setText(f"{param_value_strings_per_img[index][i]}") for i, label in enumerate(param_value_labels)]
-            [label.setText(f"{nb_count_strings_per_img[index][i]}") for i, label in enumerate(nb_count_labels)]
-            #[label.show() if label.text() != '(0)' else label.hide() for label in nb_count_labels]
-            #[label.setFont(my_font) if label.text() != '(0)' else label.setStyleSheet("color: grey;") for label in nb_count_labels]
-            [label.setStyleSheet("color: grey;") if label.text() != '(0)' else label.setStyleSheet("color: white;") for label in nb_count_labels]
-            return
-        
+        param_value_strings_per_img, nb_count_strings_per_img = self.create_param_info_per_slider_index(img_ids, chosen_param)
+
+        # precompute 2D arrays (image index x parameter) of the label texts and the count label colors, so that moving the slider only sets them
+        # (dtype=str fits the longest string, a fixed width like '<U16' could truncate long parameter values)
+        self._param_value_texts = np.array(param_value_strings_per_img, dtype=str)
+        self._nb_count_texts = np.array(nb_count_strings_per_img, dtype=str)
+        self._nb_count_styles = np.where(self._nb_count_texts != '(0)', "color: grey;", "color: white;")
+        self._param_value_labels = param_value_labels
+        self._nb_count_labels = nb_count_labels
+
         # update the label columns once at the beginning
-        update_labels(view.currentIndex, param_value_strings_per_img, nb_count_strings_per_img, param_value_labels, nb_count_labels)
+        self.update_side_labels(view.currentIndex)
 
         # slider position change triggers updating the label columns
-        view.sigTimeChanged.connect(lambda index = view.currentIndex: update_labels(index, param_value_strings_per_img, nb_count_strings_per_img, param_value_labels, nb_count_labels))
+        view.sigTimeChanged.connect(self.update_side_labels)
 
 
         # ------------------ Style the labels ------------------
@@ -177,7 +221,18 @@ class StackView(QWidget):
         return position_label, param_value_labels, nb_count_labels
 
 
-    def show_pick_axis_param_option_window(self, c, row_id, old_chosen_param=None, my_font=QFont('Courier', 10)):
+    def update_side_labels(self, index, time=None):
+        """Sets the texts of the side label columns to match the image at slider position `index` (connected to the sigTimeChanged signal of the ImageView)."""
+        for label, text in zip(self._param_value_labels, self._param_value_texts[index]):
+            label.setText(text)
+        for label, text, style in zip(self._nb_count_labels, self._nb_count_texts[index], self._nb_count_styles[index]):
+            label.setText(text)
+            label.setStyleSheet(style)
+        #[label.show() if label.text() != '(0)' else label.hide() for label in nb_count_labels]
+        #[label.setFont(my_font) if label.text() != '(0)' else label.setStyleSheet("color: grey;") for label in nb_count_labels]
+
+
+    def show_pick_axis_param_option_window(self, row_id, old_chosen_param=None, my_font=QFont('Courier', 10)):
         '''Creates a window with a list of parameters to choose from. The window is closed when the user selects a radio button.
         Returns the name of the chosen parameter.'''
 
@@ -197,23 +252,24 @@ class StackView(QWidget):
         # Create a QVBoxLayout to hold the labels
         param_buttons_layout = QVBoxLayout()
 
-        _, nb_count_strings_per_img = self.create_param_info_per_slider_index(c, img_ids=row_id)
+        _, nb_count_strings_per_img = self.create_param_info_per_slider_index(img_ids=row_id)
 
         # Create a QButtonGroup to group radio buttons
         radio_button_group = QButtonGroup()
 
         # Create a radio button for each parameter
         param_name_dict = helper_functions.create_param_name_dict()
-        button_count = 0
+        # map from button id to parameter, for finding the picked parameter when the window is closed
+        id_to_param = {}
         #print(nb_count_strings_per_img)
         for i, (key, nb_count) in enumerate(zip(param_name_dict.keys(), nb_count_strings_per_img[0])):
             if nb_count != '(0)' and key != old_chosen_param:
                 param_name = param_name_dict[key]
                 param_button = create_param_button(param_name, key, nb_count, my_font, radio_button_group, i)
                 param_buttons_layout.addWidget(param_button)
-                button_count += 1
+                id_to_param[i] = key
 
-        if button_count == 0:
+        if not id_to_param:
             # No radio buttons to show
             print("No axis parameter options to show.")
             return None
@@ -233,8 +289,8 @@ class StackView(QWidget):
             # The QDialog was closed without selecting a parameter
             print("Window closed without selecting a parameter.")
             return None
-        elif result >= 0 and result < len(param_name_dict):
-            picked_param = list(param_name_dict.keys())[result]
+        elif result in id_to_param:
+            picked_param = id_to_param[result]
             print(f"Base image id: {row_id}\nChosen axis parameter: {picked_param}\n")
 
         return picked_param
@@ -318,7 +374,21 @@ class StackView(QWidget):
         return view_widget
 
 
-    def create_param_info_per_slider_index(self, c, img_ids, chosen_param = None):
+    def create_param_matrix(self, df):
+        '''Encodes all the compared columns of the DataFrame `df` (the images table, indexed by id; every column except id and path) as integer codes, 
+        so that rows can be compared with vectorized numpy operations regardless of the column types.
+        Rows containing NULLs are left out, since NULLs never match in the SQL comparisons of find_rows_differing_by_param.
+        Returns the code matrix, the names of its columns, and a Series mapping row id to matrix row.'''
+
+        compared_columns = [col for col in df.columns if col not in ['id', 'path']]
+        codes = np.column_stack([pd.factorize(df[col])[0] for col in compared_columns])
+        valid = (codes >= 0).all(axis=1)
+        matrix_rows = pd.Series(np.arange(np.count_nonzero(valid)), index=df.index[valid])
+
+        return np.ascontiguousarray(codes[valid]), compared_columns, matrix_rows
+
+
+    def create_param_info_per_slider_index(self, img_ids, chosen_param = None):
         '''Creates strings containing static parameter values and neighbor counts for each image in img_ids.
         Returns a list of strings to be stacked into label.'''
 
@@ -328,50 +398,67 @@ class StackView(QWidget):
         #print(f"img_ids: {img_ids}")
         #print(f"type(img_ids): {type(img_ids)}")
 
-        # Get the parameter values for each image
-        param_value_strings_per_img = []
-        nb_count_strings_per_img = []
-        # initialize base_row outside the loop so that it can be checked later (as any base_row should do the trick, it doesn't matter which one is held here)
-        base_row = None
         if isinstance(img_ids, str): # in case img_ids is a string (i.e., counts as a list, but messes things up) (e.g., '28' becomes ['2', '8'])
             img_ids = int(img_ids)
         try: # in case img_ids is not a list/array (i.e. if only one image is selected)
             iter(img_ids)
         except TypeError:
-            img_ids = [img_ids]    
-        for row_id in img_ids:
-            neighbor_count_per_param = [0] * len(all_param_names) # by default no neighbors (only change if rows found)
-            for j, param_name in enumerate(all_param_names):
-                if param_name is chosen_param:
-                    continue
-                else:
-                    base_row, rows = self.find_rows_differing_by_param(c, row_id, param_name)
-                    if rows:
-                        # neighbors found
-                        neighbor_count_per_param[j] = len(rows)
-            # create string for this image
-            param_value_strings_per_img.append([f"{param_name:>4s} {base_row[base_row_value_idx]:<10}" for param_name, base_row_value_idx in zip(all_param_names, range(5,33))])
-            nb_count_strings_per_img.append([f"({nb_count})" for nb_count in neighbor_count_per_param])
+            img_ids = [img_ids]
+        img_ids = [int(row_id) for row_id in img_ids]
+
+        # Count the neighbors of the images that are not already in the cache
+        missing_ids = [row_id for row_id in img_ids if row_id not in self._nb_cache]
+        if missing_ids:
+            # Count the neighbors of the images with vectorized comparisons against all rows of the table (instead of a query per image and parameter)
+            if self._param_matrix is None:
+                params, compared_columns, matrix_rows = self.create_param_matrix(self.df)
+                # positions of the parameter columns in the matrix, looked up once
+                param_columns = [compared_columns.index(param_name) for param_name in all_param_names]
+                self._param_matrix = (params, param_columns, matrix_rows)
+            params, param_columns, matrix_rows = self._param_matrix
+
+            target_rows = matrix_rows.reindex(missing_ids)
+            has_row = target_rows.notna().to_numpy()
+            neighbor_counts_per_img = np.zeros((len(missing_ids), len(all_param_names)), dtype=np.int32)
+            neighbor_counts_per_img[has_row] = neighbor_counts(params, target_rows[has_row].astype(int).to_numpy())[:, param_columns]
+
+            # the parameter value strings of these images at once, with vectorized string operations per column
+            param_values = self.df.loc[missing_ids, all_param_names].astype(str)
+            param_value_strings_per_img = param_values.apply(lambda col: col.name.rjust(4) + ' ' + col.str.ljust(10)).values.tolist()
+            for row_id, param_value_strings, counts in zip(missing_ids, param_value_strings_per_img, neighbor_counts_per_img):
+                self._nb_cache[row_id] = (param_value_strings, counts)
+
+        # Get the parameter values and neighbor counts for each image
+        param_value_strings_per_img = [self._nb_cache[row_id][0] for row_id in img_ids]
+        neighbor_counts_per_img = np.array([self._nb_cache[row_id][1] for row_id in img_ids], dtype=np.int32).reshape(len(img_ids), len(all_param_names))
+
+        # no neighbors counted for the parameter of the current view
+        if chosen_param in all_param_names:
+            neighbor_counts_per_img[:, all_param_names.index(chosen_param)] = 0
+
+        nb_count_strings_per_img = ('(' + pd.DataFrame(neighbor_counts_per_img).astype(str) + ')').values.tolist()
 
         return param_value_strings_per_img, nb_count_strings_per_img
 
 
-    def init_ui(self, c, row_id, chosen_param):
+    def init_ui(self, row_id, chosen_param):
         """ (A.k.a. the_whole_shebang) Given a row id and a chosen parameter creates a widget with ImageView + informative labels.
         """
 
-        if not self.check_if_row_id_exists(c, row_id):
+        if not self.check_if_row_id_exists(row_id):
             print(f"Error: Row with id {row_id} does not exist in the database")
             return
-        if not self.check_if_chosen_param_exists(c, chosen_param):
+        if not self.check_if_chosen_param_exists(chosen_param):
             print(f"Error: Column {chosen_param} does not exist in the table")
             return
-        base_row, rows = self.find_rows_differing_by_param(c, row_id, chosen_param)
+        # Fetch the base row once
+        base = self.df.loc[int(row_id)]
+        base_row, rows = self.find_rows_differing_by_param(base, row_id, chosen_param)
         if not rows:
             print("No neighboring tooth images found for the given parameter")
             return
         # Load PNG images into a 3D numpy array
-        arr, img_ids, chosen_param_values = self.stack_images(c, base_row, rows, chosen_param)
+        arr, img_ids, chosen_param_values = self.stack_images(base_row, rows)
         # Create an instance of the ImageView class
         self.view = self.create_image_view(arr, chosen_param_values)
         # Set the ImageView's slider at the base image
@@ -383,7 +470,7 @@ class StackView(QWidget):
         # Connect N-key to creating a new tab # TODO: this is not working yet
         #self.connect_n_key_to_new_tab(self.view, img_ids, chosen_param)
         # Create labels around the ImageView
-        position_label, param_value_labels, nb_count_labels = self.create_info_labels(c, self.view, img_ids, chosen_param_values, chosen_param)
+        position_label, param_value_labels, nb_count_labels = self.create_info_labels(self.view, img_ids, chosen_param_values, chosen_param)
         # Create a QWidget for the ImageView
         view_widget = self.create_view_widget_and_layouts(self.view, position_label, param_value_labels, nb_count_labels)
         self.setLayout(view_widget.layout())
@@ -21,14 +21,63 @@ Note, as of now:
 import os
 import sqlite3 as db
 import re
-import pandas as pd
 import sys
-from datetime import datetime
+import time
 import csv
 import platform
+import hashlib
+import gzip
 
 import helper_functions
 
+# regexes for parsing the ToothMaker output (compiled once, used for every line/image)
+_RE_I = re.compile('i:(.*) ')
+_RE_IDX = re.compile('--- (.*)')
+_RE_PAR = re.compile('par: (.*),')
+_RE_VAL = re.compile('val: (.*)')
+_RE_TM = re.compile('ToothMaker_(.*)_')
+
+# write buffer size for the csv-files (1 MiB, so that large exports are written in few system calls)
+_CSV_BUFFER_SIZE = 1 << 20
+# csv-files with more rows than this are written gzip-compressed (fast compression level, the files compress to about a tenth)
+_CSV_GZIP_ROW_THRESHOLD = 100_000
+
+# the columns by which rows are compared when looking for duplicate images (all columns except 'id' and 'path')
+_DUPLICATE_KEY_COLUMNS = ('model', 'viewthresh', 'viewmode', 'iter', 'Egr', 'Mgr', 'Rep', 'Swi', 'Adh', 'Act', 'Inh', 'Sec', 'Da', 'Di', 'Ds', 'Int', 'Set', 'Boy', 'Dff', 'Bgr', 'Abi', 'Pbi', 'Lbi', 'Bbi', 'Rad', 'Deg', 'Dgr', 'Ntr', 'Bwi', 'Ina', 'uMgr', 'faulty')
+
+# SQL statements for finding and removing duplicate images, built once (only the table name is filled in per call, with str.format)
+# (the signatures are kept in the side table '{table_name}_sig', so that the images table keeps the schema the viewer expects)
+_SIGNATURE_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS {table_name}_sig (id INTEGER PRIMARY KEY REFERENCES {table_name}(id), sig BLOB)'
+_SIGNATURE_INSERT_SQL = 'INSERT INTO {table_name}_sig (id, sig) SELECT id, signature(' + ', '.join(f'"{column}"' for column in _DUPLICATE_KEY_COLUMNS) + ') FROM {table_name} WHERE id NOT IN (SELECT id FROM {table_name}_sig)'
+# the window pairs every duplicate with the row to be preserved (the one with the smallest id with the same signature)
+_DUPLICATES_TMP_SQL = '''
+    CREATE TEMP TABLE duplicates_tmp AS
+    SELECT 
+        t1.min_id,
+        t1.id,
+        t1.path,
+        t1.min_path
+    FROM (
+        SELECT
+            MIN(id) OVER (PARTITION BY sig) AS min_id,
+            MIN(path) OVER (PARTITION BY sig) AS min_path,
+            id,
+            path
+        FROM {table_name}_sig JOIN {table_name} USING (id)
+    ) AS t1
+    WHERE t1.id != t1.min_id
+'''
+# the rows of the removed duplicates csv-file: for each group of duplicates, first the preserved row and then the removed ones
+_DUPLICATES_SELECT_SQL = '''
+    SELECT min_id, id, path, status FROM (
+        SELECT min_id, min_id AS id, MIN(min_path) AS path, 'preserved' AS status, 0 AS removed FROM duplicates_tmp GROUP BY min_id
+        UNION ALL
+        SELECT min_id, id, path, 'removed' AS status, 1 AS removed FROM duplicates_tmp
+    )
+    ORDER BY min_id, removed, id
+'''
+_DUPLICATES_DELETE_SQL = 'DELETE FROM {table_name} WHERE id IN (SELECT id FROM duplicates_tmp)'
+_DUPLICATES_DELETE_SIGNATURES_SQL = 'DELETE FROM {table_name}_sig WHERE id IN (SELECT id FROM duplicates_tmp)'
 
 def construct_database(source_directory_name: str = r'exports', db_path: str = 'tooth_database', table_name: str = 'images', csv_separator: str = ' '):
     """Create a new database file and fill it with data. Also create a csv-file with the same data. 
@@ -58,8 +107,8 @@ def init_db(db_name: str = 'tooth_database', table_name: str = 'images'):
 
     db_path = helper_functions.get_absolute_path(db_name)
 
-    # Create a new SQLite database
-    if not os.path.exists(db_path):
+    # Create a new SQLite database (an empty file is accepted too, as get_names reserves the name by creating the file)
+    if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
         conn = db.connect(db_path)
         print(f"\nDatabase '{db_name}' created at '{db_path}'\n")
     else:
@@ -68,6 +117,10 @@ def init_db(db_name: str = 'tooth_database', table_name: str = 'images'):
     #create cursor
     c = conn.cursor()
 
+    # write-ahead logging: readers (e.g. ToothSeeker views) don't block on the journal, and fewer syncs to disk
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('PRAGMA synchronous=NORMAL')
+
     # Create a new table to store the image data
     # NOTE: 'Set'-parameter needs single quotes
     c.execute(f'''CREATE TABLE {table_name}
@@ -105,6 +158,8 @@ def init_db(db_name: str = 'tooth_database', table_name: str = 'images'):
                 Ina REAL,
                 uMgr REAL,
                 faulty BOOL);''')
+    # and the side table for the signatures used in finding duplicate images
+    c.execute(_SIGNATURE_TABLE_SQL.format(table_name=table_name))
     return conn, c
 
 
@@ -142,9 +197,9 @@ def read_job_param(folder_path):
                     # append the previous section, initialize the dictionary
                     job_dict.update({idx_nums: param_dict})
                     param_dict = {}
-                middle_line = re.findall('i:(.*) ', line)[0]
+                middle_line = _RE_I.search(line).group(1)
                 #i_num = re.findall('(.*) ---', middle_line)[0]
-                idx_nums = re.findall('--- (.*)', middle_line)[0]
+                idx_nums = _RE_IDX.search(middle_line).group(1)
                 # remove spaces from the index numbers # TODO: figure out how to do inx_nums when more than 9 steps in variables (e.g. 11 1 vs 1 11 -> both '111')
                 idx_nums = idx_nums.replace(" ", "")
                 if i==0:
@@ -153,8 +208,8 @@ def read_job_param(folder_path):
                     #print(f'{i_num} Number of variables: {n_variables}')
             # if parameter line
             else:
-                par_name = re.findall('par: (.*),', line)[0]
-                par_value = re.findall('val: (.*)', line)[0]
+                par_name = _RE_PAR.search(line).group(1)
+                par_value = _RE_VAL.search(line).group(1)
                 param_dict.update({par_name: par_value})
         # append the last section
         job_dict.update({idx_nums: param_dict})
@@ -191,8 +246,18 @@ def insert_data_to_table(complete_list, c, table_name):
     """
     insert the data from the list into the table
     """
-    for row in complete_list:
-        c.execute(f"INSERT INTO {table_name} VALUES {str(tuple(row)).replace('(', '(NULL, ')}") # the NULL is for the id
+    if not complete_list:
+        return
+    # one prepared statement for all the rows (the NULL is for the id)
+    placeholders = '(' + ', '.join(['NULL'] + ['?'] * len(complete_list[0])) + ')'
+    # NOTE: the paths were earlier written as Python string literals, which doubled the backslashes of Windows paths; 
+    # the databases and the rest of the program (e.g. imagedropwidget) expect that format, so it is kept
+    paths = [row[0].replace('\\', '\\\\') for row in complete_list]
+    # all the inserts go into the one transaction that construct_database commits
+    c.executemany(f"INSERT INTO {table_name} VALUES {placeholders}", ([path] + row[1:] for path, row in zip(paths, complete_list)))
+    # the signatures for finding duplicates go into the side table, matched to the new rows by their (unique) path
+    c.executemany(f"INSERT INTO {table_name}_sig (id, sig) SELECT id, ? FROM {table_name} WHERE path = ?",
+                  ((signature(*row[1:]), path) for path, row in zip(paths, complete_list)))
     return
 
 
@@ -218,9 +283,12 @@ def process_folder(folder_path, c, table_name):
 
     # list of 'exports/export_1/screenshots/ToothMaker_01_0000009000.png' etc.
     #image_path_list = [os.path.join(os.path.join(folder_path, 'screenshots'), filename) for filename in os.listdir(os.path.join(folder_path, 'screenshots'))]
-    image_path_list = [os.path.join(os.path.join(folder_path_from_executable, 'screenshots'), filename) for filename in os.listdir(os.path.join(folder_path, 'screenshots'))]
+    #image_path_list = [os.path.join(os.path.join(folder_path_from_executable, 'screenshots'), filename) for filename in os.listdir(os.path.join(folder_path, 'screenshots'))]
+    screenshots_path_from_executable = os.path.join(folder_path_from_executable, 'screenshots')
+    with os.scandir(os.path.join(folder_path, 'screenshots')) as entries:
+        image_path_list = [os.path.join(screenshots_path_from_executable, entry.name) for entry in entries if entry.name.endswith('.png')]
     # list of '01' (meaning tooth 0 1) etc.
-    image_id_str_list = [re.findall('ToothMaker_(.*)_', path)[0] for path in image_path_list]
+    image_id_str_list = [_RE_TM.search(path).group(1) for path in image_path_list]
     # dict of 'Di': '0.2000000' etc.
     base_param_dict = read_base_param(folder_path)
     # dict of '01': {'Di': '0.2000000', etc.} etc.
@@ -250,99 +318,151 @@ def process_all_folders(source_directory_name, c, table_name):
     #    print(f"item in os.listdir(source_directory_rel_path): '{item}'")
     
     #for item in os.listdir(source_directory_name):
-    for export_folder_of_one_scan in os.listdir(source_directory_path):
-        #item_path = os.path.join(source_directory_name, export_folder_of_one_scan)
-        folder_path = os.path.join(source_directory_path, export_folder_of_one_scan)
-        #print(f"source_directory_path: '{source_directory_path}'")
-        #print(f"export_folder_of_one_scan: '{export_folder_of_one_scan}'")
-        #print(f"folder_path: '{folder_path}'")
-        if os.path.isdir(folder_path):  # Check if the item is a directory
-            process_folder(folder_path, c, table_name)
-            print(f"Processed folder '{export_folder_of_one_scan}'")
+    #for export_folder_of_one_scan in os.listdir(source_directory_path):
+    with os.scandir(source_directory_path) as entries:
+        for entry in entries:
+            #print(f"source_directory_path: '{source_directory_path}'")
+            #print(f"export_folder_of_one_scan: '{entry.name}'")
+            #print(f"folder_path: '{entry.path}'")
+            if entry.is_dir():  # Check if the item is a directory (cached by scandir, no extra stat)
+                process_folder(entry.path, c, table_name)
+                print(f"Processed folder '{entry.name}'")
     print(f"Processed all folders in '{source_directory_name}'\n")
     return
 
+def open_csv_file(file_path, row_count):
+    """
+    open a csv-file for writing; large ones (more than _CSV_GZIP_ROW_THRESHOLD rows) are written gzip-compressed, with '.gz' added to the file name.
+    return the file object and the path of the file
+    """
+    if row_count > _CSV_GZIP_ROW_THRESHOLD:
+        file_path = f"{file_path}.gz"
+        return gzip.open(file_path, 'wt', compresslevel=1, newline=''), file_path
+    return open(file_path, 'w', newline='', buffering=_CSV_BUFFER_SIZE), file_path
+
+
 def create_csv(conn, db_path: str, table_name: str, csv_separator: str = ' '):
     """
     also copy the database data into a .csv file
     """
-    df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
     #df.to_csv(f"{db_path.replace('db', 'csv')}", index=None, sep=csv_separator, mode='a')
-    output_file_path = helper_functions.get_absolute_path(f"{db_path.replace('db', 'csv')}")
-    df.to_csv(output_file_path, index=None, sep=csv_separator, mode='a')
+    csv_path = db_path.replace('db', 'csv')
+    output_file_path = helper_functions.get_absolute_path(csv_path)
+    # stream the rows from the cursor in batches into the file, opened once (same format as the earlier pandas to_csv)
+    row_count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+    f, output_file_path = open_csv_file(output_file_path, row_count)
+    c = conn.execute(f"SELECT * FROM {table_name}")
+    with f:
+        writer = csv.writer(f, delimiter=csv_separator, lineterminator=os.linesep)
+        writer.writerow([description[0] for description in c.description])
+        while rows := c.fetchmany(100_000):
+            writer.writerows(rows)
+
+    print(f"Processed data also exported into '{os.path.basename(output_file_path)}'\n")
+
+
+def normalize_value(value):
+    """
+    return the value as a float if it is numeric (also numeric strings, as read from the ToothMaker output), otherwise unchanged
+    (so that a row gets the same signature when computed from the parsed strings on insert and from the stored values in the database)
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
 
-    print(f"Processed data also exported into '{db_path.replace('db', 'csv')}'\n")
+def signature(*values):
+    """
+    return the signature of a row: a 16-byte hash of its values in the duplicate key columns 
+    (computed on insert, and registered as the SQL function 'signature' for databases created without it)
+    """
+    return hashlib.blake2b(repr(tuple(normalize_value(value) for value in values)).encode(), digest_size=16).digest()
+
+
+def add_signatures(conn, c, table_name = 'images'):
+    """
+    make sure the side table '{table_name}_sig' has a signature for every row of the table 
+    (databases created before the signatures were computed on insert get the table created and filled here), and index it together with the id
+    (so that duplicates can be found by comparing one short column instead of 32, and the rows are read in (sig, id) order from the index without sorting)
+    """
+    c.execute(_SIGNATURE_TABLE_SQL.format(table_name=table_name))
+    conn.create_function('signature', len(_DUPLICATE_KEY_COLUMNS), signature, deterministic=True)
+    c.execute(_SIGNATURE_INSERT_SQL.format(table_name=table_name))
+    c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_sig ON {table_name}_sig(sig, id)')
+    # update the statistics, so that the planner uses the index
+    c.execute(f'ANALYZE {table_name}_sig')
+    return
 
 
 def remove_duplicate_images(db_path, table_name = 'images'):
     #conn = db.connect(db_path)
     #c = conn.cursor()
-    # the above caused a new database being created at home folder on macOS, the below should work on all platforms:
-    conn, c = helper_functions.connect_to_database(db_path)
-
-    # Identify duplicate rows based on all columns except 'id' and 'path'
-    c.execute(f'''
-        SELECT 
-            t1.min_id,
-            t1.id,
-            t1.path,
-            t1.min_path
-        FROM (
-            SELECT
-                MIN(id) OVER (PARTITION BY model, viewthresh, viewmode, iter, Egr, Mgr, Rep, Swi, Adh, Act, Inh, Sec, Da, Di, Ds, Int, "Set", Boy, Dff, Bgr, Abi, Pbi, Lbi, Bbi, Rad, Deg, Dgr, Ntr, Bwi, Ina, uMgr, faulty) AS min_id,
-                MIN(path) OVER (PARTITION BY model, viewthresh, viewmode, iter, Egr, Mgr, Rep, Swi, Adh, Act, Inh, Sec, Da, Di, Ds, Int, "Set", Boy, Dff, Bgr, Abi, Pbi, Lbi, Bbi, Rad, Deg, Dgr, Ntr, Bwi, Ina, uMgr, faulty) AS min_path,
-                id,
-                path,
-                model, viewthresh, viewmode, iter, Egr, Mgr, Rep, Swi, Adh, Act, Inh, Sec, Da, Di, Ds, Int, "Set", Boy, Dff, Bgr, Abi, Pbi, Lbi, Bbi, Rad, Deg, Dgr, Ntr, Bwi, Ina, uMgr, faulty
-            FROM {table_name}
-        ) AS t1
-        WHERE t1.id != t1.min_id
-        ORDER BY t1.min_id
+    # the above caused a new database being created at home folder on macOS, the below should work on all platforms
+    # (a connection of its own, closed at the end, so that the tuning below does not carry over to the shared connection of the views):
+    conn = db.connect(helper_functions.get_absolute_path(db_path))
+    try:
+        _remove_duplicate_images(conn, db_path, table_name)
+    finally:
+        conn.close()
+
+
+def _remove_duplicate_images(conn, db_path, table_name = 'images'):
+    """
+    find and remove the duplicate images of the table over the given connection, and export them into a csv-file
+    """
+    c = conn.cursor()
+
+    # tune the connection for the bulk update and delete: write-ahead log with fewer syncs, temporary tables in memory, larger page cache (256 MB) and memory-mapped I/O (256 MB)
+    c.executescript('''
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-262144;
+        PRAGMA mmap_size=268435456;
     ''')
 
-    duplicates = c.fetchall()
+    # do all of the following in one write transaction (committed at the end)
+    c.execute('BEGIN IMMEDIATE')
+
+    # compute the signatures of the rows (hashes of all columns except 'id' and 'path')
+    add_signatures(conn, c, table_name)
 
-    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    # Identify duplicate rows based on all columns except 'id' and 'path' (i.e. same signature), 
+    # and keep them in a temporary table (the window already pairs every duplicate with the row to be preserved, so the table is scanned only once)
+    c.execute('DROP TABLE IF EXISTS temp.duplicates_tmp')
+    c.execute(_DUPLICATES_TMP_SQL.format(table_name=table_name))
+
+    # nothing to export or delete if there are no duplicates (only the signatures are committed)
+    if c.execute('SELECT 1 FROM duplicates_tmp LIMIT 1').fetchone() is None:
+        c.execute('DROP TABLE duplicates_tmp')
+        conn.commit()
+        print("No duplicate images found.\n")
+        return
+
+    duplicate_count = c.execute('SELECT COUNT(*) FROM duplicates_tmp').fetchone()[0]
+    c.execute(_DUPLICATES_SELECT_SQL)
+
+    timestamp = time.strftime('%Y-%m-%d_%H-%M-%S')
     csv_file = f"{os.path.basename(db_path)}___removed_duplicates___{timestamp}.csv"
     # to make this work also in macOS...
     csv_file_abs_path = helper_functions.get_absolute_path(csv_file)
     # Export duplicate pairs and removed rows to a CSV file
-    with open(csv_file_abs_path, 'w', newline='') as f:
+    f, csv_file_abs_path = open_csv_file(csv_file_abs_path, duplicate_count)
+    with f:
         writer = csv.writer(f)
         writer.writerow(['min_id', 'id', 'path', 'status'])
-        for idx, dup in enumerate(duplicates):
-            if idx == 0 or dup[0] != duplicates[idx - 1][0]:
-                writer.writerow([dup[0], dup[0], dup[3], 'preserved'])
-            writer.writerow([dup[0], dup[1], dup[2], 'removed'])
-
-    # Remove duplicate rows with greater id values
-    c.execute(f'''
-        DELETE FROM {table_name}
-        WHERE id IN (
-            SELECT id
-            FROM (
-                SELECT id
-                FROM {table_name}
-                WHERE (model, viewthresh, viewmode, iter, Egr, Mgr, Rep, Swi, Adh, Act, Inh, Sec, Da, Di, Ds, Int, "Set", Boy, Dff, Bgr, Abi, Pbi, Lbi, Bbi, Rad, Deg, Dgr, Ntr, Bwi, Ina, uMgr, faulty)
-                IN (
-                    SELECT model, viewthresh, viewmode, iter, Egr, Mgr, Rep, Swi, Adh, Act, Inh, Sec, Da, Di, Ds, Int, "Set", Boy, Dff, Bgr, Abi, Pbi, Lbi, Bbi, Rad, Deg, Dgr, Ntr, Bwi, Ina, uMgr, faulty
-                    FROM {table_name}
-                    GROUP BY model, viewthresh, viewmode, iter, Egr, Mgr, Rep, Swi, Adh, Act, Inh, Sec, Da, Di, Ds, Int, "Set", Boy, Dff, Bgr, Abi, Pbi, Lbi, Bbi, Rad, Deg, Dgr, Ntr, Bwi, Ina, uMgr, faulty
-                    HAVING COUNT(*) > 1
-                ) AND id NOT IN (
-                    SELECT MIN(id)
-                    FROM {table_name}
-                    GROUP BY model, viewthresh, viewmode, iter, Egr, Mgr, Rep, Swi, Adh, Act, Inh, Sec, Da, Di, Ds, Int, "Set", Boy, Dff, Bgr, Abi, Pbi, Lbi, Bbi, Rad, Deg, Dgr, Ntr, Bwi, Ina, uMgr, faulty
-                    HAVING COUNT(*) > 1
-                )
-            )
-        )
-    ''')
+        # stream the rows straight from the cursor (the preserved rows are already interleaved by the query)
+        writer.writerows(c)
+
+    # Remove duplicate rows with greater id values (the ones paired in the temporary table)
+    c.execute(_DUPLICATES_DELETE_SQL.format(table_name=table_name))
+    c.execute(_DUPLICATES_DELETE_SIGNATURES_SQL.format(table_name=table_name))
+    c.execute('DROP TABLE duplicates_tmp')
 
     conn.commit()
-    conn.close()
     
-    print(f"Duplicate rows removed and exported to '{csv_file}' at {csv_file_abs_path}\n")
+    print(f"Duplicate rows removed and exported to '{os.path.basename(csv_file_abs_path)}' at {csv_file_abs_path}\n")
 
 
 def get_names():
@@ -367,10 +487,12 @@ def get_names():
         else:
             db_path = db_path_input + '.db'
         
-        # check if a database by that name already exists
-        if not os.path.exists(db_path):
+        # reserve the database file by creating it empty, which fails atomically if a database by that name already exists (no race between checking and creating)
+        try:
+            fd = os.open(helper_functions.get_absolute_path(db_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+            os.close(fd)
             break
-        else:
+        except FileExistsError:
             print(f"Database by the name '{db_path}' already exists! Please use another name for the database to be created.\n")
             
     # get table name
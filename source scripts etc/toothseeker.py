@@ -22,7 +22,7 @@ class MainWindow(QMainWindow):
         super().__init__()
 
         self.setGeometry(60, 100, 900, 900)
-        self.setWindowIcon(QtGui.QIcon('icon.png'))
+        self.setWindowIcon(QtGui.QIcon(helper_functions.get_absolute_path('icon.png')))
 
 
         # ------------------ Menus for opening new tabs/windows ------------------
@@ -45,6 +45,9 @@ class MainWindow(QMainWindow):
         # Add the "Close Tabs" menu to the menu bar
         self.menuBar().addMenu(self.close_tabs_menu)
 
+        # the "Close Tabs" menu actions by the widget of their tab (so that only the changed action is added/removed, instead of rebuilding the menu)
+        self._tab_actions = {}
+
         # Alternatively: Make tabs closable (with close button on the tab)
         #self.tab_widget.setTabsClosable(True)
         #self.tab_widget.tabCloseRequested.connect(self.tab_widget.removeTab)
@@ -73,10 +76,6 @@ class MainWindow(QMainWindow):
         # redundant, self.db_path is already set when the DatabaseMenu class is created
         #self.db_path = self.database_menu.db_path
 
-        # ------------------ Connect to database ------------------
-
-        self.conn, self.c = helper_functions.connect_to_database(self.db_path)
-
         # ------------------ Central widget: tabs ------------------
 
         central_widget = QWidget()
@@ -122,30 +121,40 @@ class MainWindow(QMainWindow):
         # Connect the 'new view using this image' signal from the new imageview to the function that opens a new tab
         view_widget.new_view_tab_signal.connect(self.open_new_view_tab)
 
-        self.tab_widget.addTab(view_widget, f'{view_widget.chosen_param}\n id {view_widget.row_id} ')
+        tab_name = f'{view_widget.chosen_param}\n id {view_widget.row_id} '
+        self.tab_widget.addTab(view_widget, tab_name)
         # focus on the newly created tab
         self.tab_widget.setCurrentIndex(new_tab_index - 1)
         # focus on the ImageView of the view_widget on the newly created tab (so that the arrow keys work without clicking on the view first)
         view_widget.view.setFocus(Qt.OtherFocusReason)
 
-        # Emit the signal to refresh the Close Tabs menu
+        # notify listeners that a tab was opened
         self.new_tab_signal.emit()
-        # Update the "Close Tabs" menu
-        self.update_close_tabs_menu()
+        # Add the new tab to the "Close Tabs" menu
+        self.add_close_tab_action(view_widget, tab_name)
 
     def close_tabs_or_alter_name(self, tab_widget):
-        for i in reversed(range(tab_widget.count())):
-            tab = tab_widget.widget(i)
-            tab_name = tab_widget.tabText(i)
-            # if the tab is an ImageDropWidget, close it
-            if 'ImageDrop' in tab_name:
-                tab_widget.removeTab(i)
-                tab.deleteLater()
-            # if the tab is a StackView, rename it to indicate that the database has changed
-            else:
-                tab_name_one_line = tab_name.replace('\n','')
-                new_tab_name = f"{tab_name_one_line}\n( database changed! \n next steps unreliable! )"
-                tab_widget.setTabText(i, new_tab_name)
+        # snapshot the tabs once, then split them into the ones to close and the ones to rename
+        tabs = [(tab_widget.widget(i), tab_widget.tabText(i)) for i in range(tab_widget.count())]
+        # if the tab is an ImageDropWidget, close it
+        to_remove = [i for i, (_, tab_name) in enumerate(tabs) if 'ImageDrop' in tab_name]
+        # if the tab is a StackView, rename it to indicate that the database has changed
+        to_rename = [i for i, (_, tab_name) in enumerate(tabs) if 'ImageDrop' not in tab_name]
+
+        # rename first, while the indices are still those of the snapshot
+        for i in to_rename:
+            tab, tab_name = tabs[i]
+            tab_name_one_line = tab_name.replace('\n','')
+            new_tab_name = f"{tab_name_one_line}\n( database changed! \n next steps unreliable! )"
+            tab_widget.setTabText(i, new_tab_name)
+            if tab in self._tab_actions:
+                self._tab_actions[tab].setText(new_tab_name)
+        # then remove from the end, so that the remaining indices stay valid
+        for i in reversed(to_remove):
+            tab, _ = tabs[i]
+            tab_widget.removeTab(i)
+            self.remove_close_tab_action(tab)
+            tab.deleteLater()
 
     def open_new_imagedrop_tab(self):
         """Opens a new imagedrop tab with the new database, closes all existing image drop tabs, and renames all view tabs to indicate that the database has changed"""
@@ -161,28 +170,34 @@ class MainWindow(QMainWindow):
         self.tab_widget.addTab(image_drop_widget, f'ImageDrop')
         # focus on the newly created tab
         self.tab_widget.setCurrentIndex(new_tab_index - 1)
-        # Emit the signal to refresh the Close Tabs menu
+        # notify listeners that a tab was opened
         self.new_tab_signal.emit()
-        # Update the "Close Tabs" menu
-        self.update_close_tabs_menu()
+        # Add the new tab to the "Close Tabs" menu
+        self.add_close_tab_action(image_drop_widget, 'ImageDrop')
 
     # ------------------ functions for closing tabs ------------------
 
-    def update_close_tabs_menu(self):
-        # Remove all actions from the "Close Tabs" menu
-        self.close_tabs_menu.clear()
-
-        # Add actions for each tab in the tab widget
-        for i in range(self.tab_widget.count()):
-            tab_name = self.tab_widget.tabText(i)
-            close_action = QAction(f'{tab_name}', self)
-            close_action.triggered.connect(lambda checked, idx=i: self.close_tab(idx))
-            self.close_tabs_menu.addAction(close_action)
-
-    def close_tab(self, index):
-        # Remove the tab and update the "Close Tabs" menu
-        self.tab_widget.removeTab(index)
-        self.update_close_tabs_menu()
+    def add_close_tab_action(self, widget, tab_name):
+        """Adds an action for closing the tab of `widget` to the "Close Tabs" menu."""
+        close_action = QAction(f'{tab_name}', self)
+        # the action refers to the tab by its widget, since the indices of the tabs change when tabs are closed
+        close_action.triggered.connect(lambda checked, tab=widget: self.close_tab(tab))
+        self.close_tabs_menu.addAction(close_action)
+        self._tab_actions[widget] = close_action
+
+    def remove_close_tab_action(self, widget):
+        """Removes the action of the tab of `widget` from the "Close Tabs" menu."""
+        close_action = self._tab_actions.pop(widget, None)
+        if close_action is not None:
+            self.close_tabs_menu.removeAction(close_action)
+            close_action.deleteLater()
+
+    def close_tab(self, widget):
+        # Remove the tab and its action in the "Close Tabs" menu
+        index = self.tab_widget.indexOf(widget)
+        if index != -1:
+            self.tab_widget.removeTab(index)
+        self.remove_close_tab_action(widget)
 
     # ------------------ functions for opening new windows ------------------
 